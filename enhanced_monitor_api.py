@@ -8,26 +8,52 @@ Version: 2.0 (Production Ready)
 """
 
 import json
+import re
 import time
+import atexit
+import sched
 import psutil
 import threading
+import multiprocessing
+import queue
 import traceback
 import secrets
+import hashlib
+import hmac
 from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Dict, List, Any, Optional
-from dataclasses import dataclass, asdict
+from collections import OrderedDict
+from types import MappingProxyType
+from cachetools import TTLCache
+from dataclasses import dataclass
 from flask import Flask, jsonify, request, g
+from flask.json.provider import JSONProvider, DefaultJSONProvider
 from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
-from functools import wraps
+from limits.storage import Storage
+from concurrent.futures import ProcessPoolExecutor
+from load_simulation import load_kernel
 import logging
 import os
 import sys
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import check_password_hash
 import psycopg2
-from psycopg2.extras import DictCursor
+from psycopg2.pool import ThreadedConnectionPool, PoolError
+from psycopg2.extras import (
+    DictCursor, MinTimeLoggingConnection, MinTimeLoggingCursor, execute_values
+)
+
+try:
+    import orjson
+except ImportError:  # Fall back to Flask's stdlib json provider
+    orjson = None
+
+try:
+    import prometheus_client
+except ImportError:  # /metrics is only served when prometheus_client is installed
+    prometheus_client = None
 
 # Configure logging
 logging.basicConfig(
@@ -36,20 +62,69 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Response timestamps only need second resolution, so each second is formatted once
+_iso_cache = (0, '')
+
+def iso_now() -> str:
+    """Current local time as an ISO 8601 string"""
+    global _iso_cache
+    now = int(time.time())
+    cached = _iso_cache
+    if cached[0] != now:
+        cached = (now, datetime.fromtimestamp(now).isoformat())
+        _iso_cache = cached
+    return cached[1]
+
 # Configuration
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY', secrets.token_hex(32))
     API_KEYS = os.environ.get('API_KEYS', '').split(',') if os.environ.get('API_KEYS') else []
     DATABASE_URL = os.environ.get('DATABASE_URL')
     MAX_HISTORY_RECORDS = int(os.environ.get('MAX_HISTORY_RECORDS', 10000))
+    # Background task intervals in seconds
+    MONITOR_SAMPLE_INTERVAL = float(os.environ.get('MONITOR_SAMPLE_INTERVAL', 5))
+    MONITOR_CHECK_INTERVAL = float(os.environ.get('MONITOR_CHECK_INTERVAL', 30))
+    CLEANUP_INTERVAL = float(os.environ.get('CLEANUP_INTERVAL', 300))
     RATE_LIMIT = os.environ.get('RATE_LIMIT', '100 per hour')
+    # Use redis:// to share rate limits across workers and instances
+    RATE_LIMIT_STORAGE_URI = os.environ.get('RATE_LIMIT_STORAGE_URI', 'memorysharded://')
     DEBUG = os.environ.get('DEBUG', 'False').lower() == 'true'
+    # The writer thread commits a batch when either limit is reached
+    WRITE_BATCH_SIZE = int(os.environ.get('WRITE_BATCH_SIZE', 500))
+    WRITE_FLUSH_INTERVAL = float(os.environ.get('WRITE_FLUSH_INTERVAL', 2.0))
+    # Writes queued beyond this are dropped, e.g. while the database is down
+    WRITE_QUEUE_SIZE = int(os.environ.get('WRITE_QUEUE_SIZE', 10000))
+    # A batch that fails on a connection error is retried this many times with backoff
+    WRITE_RETRY_ATTEMPTS = int(os.environ.get('WRITE_RETRY_ATTEMPTS', 3))
+    WRITE_RETRY_BACKOFF = float(os.environ.get('WRITE_RETRY_BACKOFF', 1.0))
+    # Session settings applied to every database connection
+    DB_CONNECT_TIMEOUT = int(os.environ.get('DB_CONNECT_TIMEOUT', 30))
+    DB_LOCK_TIMEOUT_MS = int(os.environ.get('DB_LOCK_TIMEOUT_MS', 30000))
+    DB_SYNCHRONOUS_COMMIT = os.environ.get('DB_SYNCHRONOUS_COMMIT', 'off')
+    # Per-process pool of request connections. psycopg2 closes returned
+    # connections beyond DB_POOL_MIN, so keep min == max to actually reuse them
+    DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', 10))
+    DB_POOL_MIN = int(os.environ.get('DB_POOL_MIN', DB_POOL_MAX))
+    # With DEBUG on, statements slower than this are logged by psycopg2
+    DB_SLOW_QUERY_MS = float(os.environ.get('DB_SLOW_QUERY_MS', 100))
+    # Validated API keys are remembered per process for this long
+    API_KEY_CACHE_SIZE = int(os.environ.get('API_KEY_CACHE_SIZE', 1024))
+    API_KEY_CACHE_TTL = float(os.environ.get('API_KEY_CACHE_TTL', 300))
+    # Requests serve the background sampler's metrics; they only sample
+    # themselves when the cached sample is older than this
+    METRICS_MAX_AGE = float(os.environ.get('METRICS_MAX_AGE', 2 * MONITOR_SAMPLE_INTERVAL))
+    # Shortest window a CPU usage sample may cover
+    CPU_SAMPLE_MIN_WINDOW = float(os.environ.get('CPU_SAMPLE_MIN_WINDOW', 0.5))
+    DISK_USAGE_MAX_AGE = float(os.environ.get('DISK_USAGE_MAX_AGE', 5.0))
+    # History query results are reused for this many seconds
+    RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', 512))
+    RESPONSE_CACHE_TTL = float(os.environ.get('RESPONSE_CACHE_TTL', 2.0))
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class PerformanceMetrics:
     """Data class for performance metrics"""
     id: Optional[int]
-    timestamp: str
+    timestamp: float
     cpu_usage: float
     memory_usage: float
     disk_usage: float
@@ -59,16 +134,22 @@ class PerformanceMetrics:
     function_name: str
     status: str
     api_key: Optional[str] = None
+    
+    def to_tuple(self) -> tuple:
+        """Row values in _METRIC_SQL column order"""
+        return (self.timestamp, self.cpu_usage, self.memory_usage,
+                self.disk_usage, self.network_sent, self.network_recv,
+                self.execution_time, self.function_name, self.status, self.api_key)
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class ErrorLog:
     """Data class for error logging"""
     id: Optional[int]
-    timestamp: str
+    timestamp: float
     level: str
     error_type: str
     message: str
-    traceback_info: str
+    traceback_info: Optional[str]
     function_name: str
     cpu_impact: float
     memory_impact: float
@@ -76,6 +157,77 @@ class ErrorLog:
     explanation: str
     suggested_fix: str
     api_key: Optional[str] = None
+    
+    def to_tuple(self) -> tuple:
+        """Row values in _ERROR_SQL column order"""
+        return (self.timestamp, self.level, self.error_type, self.message,
+                self.traceback_info, self.function_name, self.cpu_impact,
+                self.memory_impact, self.severity, self.explanation,
+                self.suggested_fix, self.api_key)
+
+# Batched write statements, built once at import
+_METRIC_SQL = '''
+    INSERT INTO metrics (timestamp, cpu_usage, memory_usage, disk_usage,
+                       network_sent, network_recv, execution_time, 
+                       function_name, status, api_key)
+    VALUES %s
+'''
+_METRIC_TEMPLATE = '(' + ', '.join(['%s'] * 10) + ')'
+
+_ERROR_SQL = '''
+    INSERT INTO errors (timestamp, level, error_type, message, traceback_info,
+                      function_name, cpu_impact, memory_impact, severity,
+                      explanation, suggested_fix, api_key)
+    VALUES %s
+'''
+_ERROR_TEMPLATE = '(' + ', '.join(['%s'] * 12) + ')'
+
+_TOUCH_KEYS_SQL = '''
+    UPDATE api_keys 
+    SET last_used = CURRENT_TIMESTAMP 
+    WHERE key_lookup = ANY(%s)
+'''
+
+_UPGRADE_KEY_SQL = '''
+    UPDATE api_keys SET key_hash = %s, key_lookup = %s WHERE id = %s
+'''
+
+# Database metrics, exported on /metrics
+if prometheus_client:
+    DB_WRITE_BATCH_LATENCY = prometheus_client.Histogram(
+        'db_write_batch_latency_seconds', 'Time to write and commit one batch of queued writes'
+    )
+    DB_POOL_IN_USE = prometheus_client.Gauge(
+        'db_pool_in_use', 'Request connections currently checked out of the pool'
+    )
+
+# Slow statements are logged by psycopg2's cursor, so call sites stay unwrapped
+sql_logger = logging.getLogger(f"{__name__}.sql")
+sql_logger.setLevel(logging.DEBUG)
+
+# Quoted values in interpolated SQL, which include API keys and their digests
+_SQL_LITERAL = re.compile(r"'(?:[^']|'')*'")
+
+class SlowQueryConnection(MinTimeLoggingConnection):
+    """Connection that logs statements slower than DB_SLOW_QUERY_MS"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.initialize(sql_logger, mintime=Config.DB_SLOW_QUERY_MS)
+    
+    def filter(self, msg, curs):
+        # Log the statement shape only, never the values bound into it
+        msg = super().filter(msg, curs)
+        return _SQL_LITERAL.sub("'?'", msg) if msg else msg
+
+class SlowQueryDictCursor(MinTimeLoggingCursor, DictCursor):
+    """DictCursor that records statement start times for SlowQueryConnection"""
+
+# Errors caused by the rows themselves; psycopg2 raises ValueError client-side for NUL bytes
+_BAD_ROW_ERRORS = (psycopg2.DataError, psycopg2.IntegrityError, ValueError)
+
+# Advisory lock held by the one process that checks thresholds and cleans up
+_MONITOR_LOCK_ID = 0x706d6f6e
 
 class DatabaseManager:
     """Handle all database operations"""
@@ -84,19 +236,80 @@ class DatabaseManager:
         if not db_url:
             raise ValueError("DATABASE_URL is not set. Cannot initialize DatabaseManager.")
         self.db_url = db_url
+        
+        # All writes go through one writer thread that owns its own connection;
+        # queued items are (kind, payload) tuples
+        self._writer_q: "queue.Queue[tuple]" = queue.Queue(maxsize=Config.WRITE_QUEUE_SIZE)
+        self._dropped_writes = 0
+        self._writer_thread: Optional[threading.Thread] = None
+        self._writer_lock = threading.Lock()
+        self._writer_conn = None
+        
+        # Connection used by the background monitor thread; the leader holds
+        # the monitor advisory lock on it
+        self._monitor_conn = None
+        self._monitor_leader = False
+        
+        # Request connection pool, created on first use so each worker process gets its own
+        self._pool: Optional[ThreadedConnectionPool] = None
+        self._pool_lock = threading.Lock()
+        # getconn raises instead of waiting when the pool is exhausted, so
+        # requests wait here for a free connection
+        self._pool_slots = threading.BoundedSemaphore(Config.DB_POOL_MAX)
+        
+        # LRU of validated key lookups -> cache expiry
+        self._key_cache: "OrderedDict[str, float]" = OrderedDict()
+        self._key_cache_lock = threading.Lock()
+        
         if initialize:
             self._initialize_database()
     
+    def _connection_kwargs(self, writer: bool = False, readonly: bool = False) -> Dict[str, Any]:
+        """Build psycopg2.connect arguments with session settings applied"""
+        options = f"-c lock_timeout={Config.DB_LOCK_TIMEOUT_MS}"
+        if readonly:
+            options += " -c default_transaction_read_only=on"
+        if writer:
+            # Metrics tolerate losing the last few commits on a crash, so don't
+            # wait for the WAL flush on every batch
+            options += f" -c synchronous_commit={Config.DB_SYNCHRONOUS_COMMIT}"
+        
+        kwargs = {
+            'connect_timeout': Config.DB_CONNECT_TIMEOUT,
+            'options': options
+        }
+        if Config.DEBUG:
+            kwargs['connection_factory'] = SlowQueryConnection
+        return kwargs
+    
+    def _connect(self, writer: bool = False):
+        """Open a database connection with session settings applied"""
+        return psycopg2.connect(self.db_url, **self._connection_kwargs(writer))
+    
+    def _get_pool(self) -> ThreadedConnectionPool:
+        """Get the request connection pool, creating it on first use"""
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = ThreadedConnectionPool(
+                        Config.DB_POOL_MIN,
+                        Config.DB_POOL_MAX,
+                        self.db_url,
+                        cursor_factory=SlowQueryDictCursor if Config.DEBUG else DictCursor,
+                        **self._connection_kwargs(readonly=True)
+                    )
+        return self._pool
+    
     def _initialize_database(self):
         """Create database tables if they don't exist"""
-        conn = psycopg2.connect(self.db_url)
+        conn = self._connect()
         cursor = conn.cursor()
         
         # Performance metrics table
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS metrics (
                 id SERIAL PRIMARY KEY,
-                timestamp TEXT NOT NULL,
+                timestamp DOUBLE PRECISION NOT NULL,
                 cpu_usage DOUBLE PRECISION,
                 memory_usage DOUBLE PRECISION,
                 disk_usage DOUBLE PRECISION,
@@ -114,7 +327,7 @@ class DatabaseManager:
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS errors (
                 id SERIAL PRIMARY KEY,
-                timestamp TEXT NOT NULL,
+                timestamp DOUBLE PRECISION NOT NULL,
                 level TEXT,
                 error_type TEXT,
                 message TEXT,
@@ -135,6 +348,7 @@ class DatabaseManager:
             CREATE TABLE IF NOT EXISTS api_keys (
                 id SERIAL PRIMARY KEY,
                 key_hash TEXT UNIQUE NOT NULL,
+                key_lookup TEXT UNIQUE,
                 key_name TEXT,
                 created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
                 last_used TIMESTAMP WITH TIME ZONE,
@@ -142,84 +356,239 @@ class DatabaseManager:
             )
         ''')
         
-        # Indexes for better query performance
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_metrics_timestamp ON metrics(timestamp)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_errors_timestamp ON errors(timestamp)')
+        # Timestamps used to be stored as ISO strings, convert them to unix epoch
+        for table in ('metrics', 'errors'):
+            cursor.execute('''
+                SELECT data_type FROM information_schema.columns
+                WHERE table_schema = current_schema() AND table_name = %s AND column_name = 'timestamp'
+            ''', (table,))
+            if cursor.fetchone()[0] == 'text':
+                cursor.execute(f'''
+                    ALTER TABLE {table} ALTER COLUMN timestamp TYPE DOUBLE PRECISION
+                    USING EXTRACT(EPOCH FROM timestamp::timestamp)
+                ''')
+        
+        # Keys created before key_lookup existed are backfilled on first use
+        cursor.execute('ALTER TABLE api_keys ADD COLUMN IF NOT EXISTS key_lookup TEXT UNIQUE')
+        
+        # Thresholds shared by every worker process
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS thresholds (
+                name TEXT PRIMARY KEY,
+                value DOUBLE PRECISION NOT NULL
+            )
+        ''')
+        
+        # Indexes for better query performance, matching the per-key history queries
+        # History is returned newest first by id, which also serves as the page cursor
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_metrics_key_id ON metrics(api_key, id DESC)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_errors_key_id ON errors(api_key, id DESC)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_errors_key_level_id ON errors(api_key, level, id DESC)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_errors_level ON errors(level)')
         
+        # Nothing filters or sorts on timestamp or created_at
+        cursor.execute('DROP INDEX IF EXISTS idx_metrics_timestamp')
+        cursor.execute('DROP INDEX IF EXISTS idx_errors_timestamp')
+        cursor.execute('DROP INDEX IF EXISTS idx_metrics_key_created')
+        cursor.execute('DROP INDEX IF EXISTS idx_errors_key_created')
+        cursor.execute('DROP INDEX IF EXISTS idx_errors_key_level_created')
+        
         conn.commit()
         conn.close()
         logger.info("Database initialized successfully")
     
     def get_connection(self):
-        """Get database connection"""
+        """Get read-only database connection for the current request"""
         # Use Flask's application context 'g' to store the connection for the request
         if 'db_conn' not in g:
-            g.db_conn = psycopg2.connect(self.db_url)
-            g.db_conn.cursor_factory = DictCursor
+            if not self._pool_slots.acquire(timeout=Config.DB_CONNECT_TIMEOUT):
+                raise PoolError("timed out waiting for a free database connection")
+            try:
+                conn = self._get_pool().getconn()
+            except Exception:
+                self._pool_slots.release()
+                raise
+            # Requests only read, so skip the BEGIN/ROLLBACK round-trips
+            conn.autocommit = True
+            g.db_conn = conn
+            if prometheus_client:
+                DB_POOL_IN_USE.inc()
         return g.db_conn
     
-    def save_metric(self, metric: PerformanceMetrics):
-        """Save performance metric to database"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO metrics (timestamp, cpu_usage, memory_usage, disk_usage,
-                               network_sent, network_recv, execution_time, 
-                               function_name, status, api_key)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        ''', (metric.timestamp, metric.cpu_usage, metric.memory_usage, 
-              metric.disk_usage, metric.network_sent, metric.network_recv,
-              metric.execution_time, metric.function_name, metric.status, metric.api_key))
-        
-        conn.commit() # Connection will be closed at the end of the request
+    def release_connection(self, conn):
+        """Return a request connection to the pool"""
+        # The pool discards closed connections
+        try:
+            self._get_pool().putconn(conn)
+        finally:
+            self._pool_slots.release()
+        if prometheus_client:
+            DB_POOL_IN_USE.dec()
+    
+    def _get_writer_connection(self):
+        """Get the long-lived connection used by the writer thread"""
+        if self._writer_conn is None or self._writer_conn.closed:
+            self._writer_conn = self._connect(writer=True)
+        return self._writer_conn
+    
+    def _enqueue(self, kind: str, payload: Any = None):
+        """Hand a write to the writer thread, starting it on first use"""
+        if self._writer_thread is None:
+            with self._writer_lock:
+                if self._writer_thread is None:
+                    self._writer_thread = threading.Thread(target=self._writer_loop, daemon=True)
+                    self._writer_thread.start()
         
-        # Cleanup old records
-        self._cleanup_old_metrics()
+        try:
+            self._writer_q.put_nowait((kind, payload))
+        except queue.Full:
+            # Never block a request on the database; warn on the first drop and every 1000th after
+            self._dropped_writes += 1
+            if self._dropped_writes % 1000 == 1:
+                logger.warning(f"Write queue full, dropped {self._dropped_writes} writes so far")
+    
+    def save_metric(self, metric: PerformanceMetrics):
+        """Queue performance metric for the next batched write"""
+        self._enqueue('metric', metric.to_tuple())
     
     def save_error(self, error: ErrorLog):
-        """Save error log to database"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        """Queue error log for the next batched write"""
+        self._enqueue('error', error.to_tuple())
+    
+    def flush(self, timeout: float = 5.0):
+        """Wait until everything queued so far has been written"""
+        if self._writer_thread is None:
+            return
+        done = threading.Event()
+        self._enqueue('flush', done)
+        done.wait(timeout)
+    
+    def cleanup_old_metrics(self):
+        """Queue removal of old metrics on the writer thread"""
+        self._enqueue('cleanup')
+    
+    def _writer_loop(self):
+        """Collect queued writes into batches and commit each in one transaction"""
+        while True:
+            batch = [self._writer_q.get()]
+            deadline = time.monotonic() + Config.WRITE_FLUSH_INTERVAL
+            
+            # Keep collecting until the batch is full, the interval is up or a flush is requested
+            while len(batch) < Config.WRITE_BATCH_SIZE and batch[-1][0] not in ('flush', 'cleanup'):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._writer_q.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            
+            self._write_batch(batch)
+    
+    def _write_batch(self, batch: List[tuple]):
+        """Write one batch of queued items, falling back to one item at a time"""
+        writes = [item for item in batch if item[0] != 'flush']
+        start_time = time.perf_counter()
         
-        cursor.execute('''
-            INSERT INTO errors (timestamp, level, error_type, message, traceback_info,
-                              function_name, cpu_impact, memory_impact, severity,
-                              explanation, suggested_fix, api_key)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        ''', (error.timestamp, error.level, error.error_type, error.message,
-              error.traceback_info, error.function_name, error.cpu_impact,
-              error.memory_impact, error.severity, error.explanation,
-              error.suggested_fix, error.api_key))
-        
-        conn.commit() # Connection will be closed at the end of the request
-    
-    def get_metrics(self, limit: int = 100, api_key: Optional[str] = None):
-        """Retrieve performance metrics"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        # Don't log through the monitor in here, that would queue another write
+        try:
+            if writes:
+                self._commit_with_retry(writes)
+                if prometheus_client:
+                    DB_WRITE_BATCH_LATENCY.observe(time.perf_counter() - start_time)
+        except _BAD_ROW_ERRORS as e:
+            logger.error(f"Failed to write batch of {len(writes)} items, retrying individually: {e}")
+            
+            # Only the offending rows are dropped
+            for i, item in enumerate(writes):
+                try:
+                    self._commit_items([item])
+                except _BAD_ROW_ERRORS as e:
+                    logger.error(f"Dropped queued {item[0]} write: {e}")
+                except Exception as e:
+                    self._reset_writer_connection()
+                    logger.error(f"Dropped {len(writes) - i} queued writes: {e}")
+                    break
+        except Exception as e:
+            logger.error(f"Dropped batch of {len(writes)} queued writes: {e}")
+        finally:
+            for kind, payload in batch:
+                if kind == 'flush':
+                    payload.set()
+    
+    def _commit_with_retry(self, items: List[tuple]):
+        """Commit queued items, retrying with backoff while the database is unreachable"""
+        for attempt in range(Config.WRITE_RETRY_ATTEMPTS + 1):
+            try:
+                return self._commit_items(items)
+            except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                self._reset_writer_connection()
+                if attempt == Config.WRITE_RETRY_ATTEMPTS:
+                    raise
+                delay = Config.WRITE_RETRY_BACKOFF * 2 ** attempt
+                logger.warning(f"Database write failed, retrying in {delay:.1f}s: {e}")
+                time.sleep(delay)
+    
+    def _reset_writer_connection(self):
+        """Discard the writer connection so the next write reconnects"""
+        if self._writer_conn is not None and not self._writer_conn.closed:
+            try:
+                self._writer_conn.close()
+            except Exception:
+                pass
+        self._writer_conn = None
+    
+    def _commit_items(self, items: List[tuple]):
+        """Write queued items in a single transaction"""
+        metrics = [payload for kind, payload in items if kind == 'metric']
+        errors = [payload for kind, payload in items if kind == 'error']
+        touched = {payload for kind, payload in items if kind == 'touch'}
+        upgrades = [payload for kind, payload in items if kind == 'upgrade']
+        cleanup = any(kind == 'cleanup' for kind, _ in items)
         
-        query = 'SELECT * FROM metrics'
+        conn = self._get_writer_connection()
+        # Commits on success, rolls back on error
+        with conn, conn.cursor() as cursor:
+            # One multi-row statement per table for the whole batch
+            if metrics:
+                execute_values(cursor, _METRIC_SQL, metrics,
+                               template=_METRIC_TEMPLATE, page_size=len(metrics))
+            
+            if errors:
+                execute_values(cursor, _ERROR_SQL, errors,
+                               template=_ERROR_TEMPLATE, page_size=len(errors))
+            
+            for lookup, key_id in upgrades:
+                cursor.execute(_UPGRADE_KEY_SQL, (lookup, lookup, key_id))
+            
+            if touched:
+                cursor.execute(_TOUCH_KEYS_SQL, (list(touched),))
+            
+            if cleanup:
+                self._cleanup_old_metrics(cursor)
+    
+    def _metrics_query(self, limit: int, api_key: Optional[str], before_id: Optional[int] = None):
+        """Build the performance metrics history query"""
+        query = 'SELECT * FROM metrics WHERE 1=1'
         params = []
         
         if api_key:
-            query += ' WHERE api_key = %s'
+            query += ' AND api_key = %s'
             params.append(api_key)
         
-        query += ' ORDER BY created_at DESC LIMIT %s'
-        params.append(limit)
+        if before_id is not None:
+            query += ' AND id < %s'
+            params.append(before_id)
         
-        cursor.execute(query, params)
-        rows = cursor.fetchall()
+        # Rows in one write batch share created_at, so order by id to keep pages stable
+        query += ' ORDER BY id DESC LIMIT %s'
+        params.append(limit)
         
-        return [dict(row) for row in rows]
+        return query, params
     
-    def get_errors(self, limit: int = 50, level: Optional[str] = None, api_key: Optional[str] = None):
-        """Retrieve error logs"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
+    def _errors_query(self, limit: int, level: Optional[str], api_key: Optional[str],
+                      before_id: Optional[int] = None):
+        """Build the error log history query"""
         query = 'SELECT * FROM errors WHERE 1=1'
         params = []
         
@@ -231,66 +600,248 @@ class DatabaseManager:
             query += ' AND api_key = %s'
             params.append(api_key)
         
-        query += ' ORDER BY created_at DESC LIMIT %s'
+        if before_id is not None:
+            query += ' AND id < %s'
+            params.append(before_id)
+        
+        query += ' ORDER BY id DESC LIMIT %s'
         params.append(limit)
         
-        cursor.execute(query, params)
+        return query, params
+    
+    def _fetch_json(self, query: str, params: list):
+        """Run a query and return its rows as a JSON array string, plus the row count"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        # Let PostgreSQL encode the rows; cast to text so psycopg2 doesn't parse it back
+        cursor.execute(f'''
+            SELECT COALESCE(json_agg(t ORDER BY t.id DESC), '[]')::text, COUNT(*)
+            FROM ({query}) t
+        ''', params)
+        rows_json, count = cursor.fetchone()
+        
+        return rows_json, count
+    
+    def get_metrics(self, limit: int = 100, api_key: Optional[str] = None, before_id: Optional[int] = None):
+        """Retrieve performance metrics"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute(*self._metrics_query(limit, api_key, before_id))
         rows = cursor.fetchall()
         
         return [dict(row) for row in rows]
     
-    def _cleanup_old_metrics(self):
-        """Remove old metrics to prevent database bloat"""
+    def get_metrics_json(self, limit: int = 100, api_key: Optional[str] = None,
+                         before_id: Optional[int] = None):
+        """Retrieve performance metrics as a JSON array string and row count"""
+        return self._fetch_json(*self._metrics_query(limit, api_key, before_id))
+    
+    def get_errors(self, limit: int = 50, level: Optional[str] = None, api_key: Optional[str] = None,
+                   before_id: Optional[int] = None):
+        """Retrieve error logs"""
         conn = self.get_connection()
         cursor = conn.cursor()
         
+        cursor.execute(*self._errors_query(limit, level, api_key, before_id))
+        rows = cursor.fetchall()
+        
+        return [dict(row) for row in rows]
+    
+    def get_errors_json(self, limit: int = 50, level: Optional[str] = None, api_key: Optional[str] = None,
+                        before_id: Optional[int] = None):
+        """Retrieve error logs as a JSON array string and row count"""
+        return self._fetch_json(*self._errors_query(limit, level, api_key, before_id))
+    
+    def _cleanup_old_metrics(self, cursor):
+        """Remove old metrics to prevent database bloat"""
+        # Ids follow insertion order, so MAX - MIN is a cheap upper bound on the row count
+        cursor.execute('SELECT MIN(id), MAX(id) FROM metrics')
+        lowest, highest = cursor.fetchone()
+        if lowest is None or highest - lowest + 1 <= Config.MAX_HISTORY_RECORDS * 1.1:
+            return
+        
+        # Keep the newest MAX_HISTORY_RECORDS rows
         cursor.execute('''
-            DELETE FROM metrics WHERE id NOT IN (
-                SELECT id FROM metrics ORDER BY created_at DESC LIMIT ?
-            )
-        ''', (Config.MAX_HISTORY_RECORDS,)) # PostgreSQL uses '?' as placeholder, but psycopg2 converts it
+            DELETE FROM metrics
+            WHERE id < (SELECT id FROM metrics ORDER BY id DESC LIMIT 1 OFFSET %s)
+        ''', (Config.MAX_HISTORY_RECORDS - 1,))
+    
+    def _get_monitor_connection(self):
+        """Get the background monitor's connection, reconnecting if it was lost"""
+        if self._monitor_conn is not None and not self._monitor_conn.closed:
+            try:
+                with self._monitor_conn.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                return self._monitor_conn
+            except psycopg2.Error:
+                self._monitor_conn.close()
         
-        conn.commit() # Connection will be closed at the end of the request
+        # A new session never holds the advisory lock, whatever the old one had
+        self._monitor_conn = self._connect()
+        self._monitor_conn.autocommit = True
+        self._monitor_leader = False
+        return self._monitor_conn
+    
+    def is_monitor_leader(self) -> bool:
+        """Check whether this process runs the once-per-deployment background tasks"""
+        conn = self._get_monitor_connection()
+        if not self._monitor_leader:
+            # Session-level lock, released by PostgreSQL if this process goes away
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT pg_try_advisory_lock(%s)', (_MONITOR_LOCK_ID,))
+                self._monitor_leader = cursor.fetchone()[0]
+        return self._monitor_leader
+    
+    def load_thresholds(self) -> Dict[str, float]:
+        """Read thresholds saved by any worker"""
+        with self._get_monitor_connection().cursor() as cursor:
+            cursor.execute('SELECT name, value FROM thresholds')
+            return dict(cursor.fetchall())
+    
+    def save_thresholds(self, thresholds: Dict[str, float]):
+        """Store thresholds so every worker picks them up"""
+        conn = self._connect()
+        try:
+            with conn, conn.cursor() as cursor:
+                execute_values(cursor, '''
+                    INSERT INTO thresholds (name, value) VALUES %s
+                    ON CONFLICT (name) DO UPDATE SET value = EXCLUDED.value
+                ''', list(thresholds.items()))
+        finally:
+            conn.close()
+    
+    @staticmethod
+    def _key_lookup(api_key: str) -> str:
+        """Fast, indexable digest used to find a key's row"""
+        # Keys are 256-bit random tokens, so a plain SHA-256 is enough; a slow
+        # password hash adds nothing against guessing
+        return hashlib.sha256(api_key.encode()).hexdigest()
     
     def create_api_key(self, key_name: str) -> str:
         """Create a new API key"""
         api_key = f"pm_{secrets.token_urlsafe(32)}"
-        key_hash = generate_password_hash(api_key)
-        
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        key_hash = self._key_lookup(api_key)
         
-        cursor.execute('''
-            INSERT INTO api_keys (key_hash, key_name)
-            VALUES (%s, %s)
-        ''', (key_hash, key_name))
-        
-        conn.commit() # Connection will be closed at the end of the request
+        # Request connections are read-only, so use a short-lived one
+        conn = self._connect()
+        try:
+            with conn, conn.cursor() as cursor:
+                cursor.execute('''
+                    INSERT INTO api_keys (key_hash, key_lookup, key_name)
+                    VALUES (%s, %s, %s)
+                ''', (key_hash, key_hash, key_name))
+        finally:
+            conn.close()
         
         logger.info(f"Created new API key: {key_name}")
         return api_key
     
     def validate_api_key(self, api_key: str) -> bool:
         """Validate an API key"""
+        lookup = self._key_lookup(api_key)
+        
+        if not self._is_cached_key(lookup):
+            if not self._check_api_key(api_key, lookup):
+                return False
+            self._cache_key(lookup)
+        
+        # Last used timestamp is updated with the next batched write
+        self._enqueue('touch', lookup)
+        
+        return True
+    
+    def revoke_api_key(self, api_key: str):
+        """Deactivate an API key"""
+        lookup = self._key_lookup(api_key)
+        
+        conn = self._connect()
+        try:
+            with conn, conn.cursor() as cursor:
+                cursor.execute('''
+                    UPDATE api_keys SET is_active = FALSE WHERE key_lookup = %s
+                ''', (lookup,))
+        finally:
+            conn.close()
+        
+        with self._key_cache_lock:
+            self._key_cache.pop(lookup, None)
+    
+    def _is_cached_key(self, lookup: str) -> bool:
+        """Check whether a key was validated recently"""
+        with self._key_cache_lock:
+            expires = self._key_cache.get(lookup)
+            if expires is None:
+                return False
+            if expires < time.monotonic():
+                del self._key_cache[lookup]
+                return False
+            self._key_cache.move_to_end(lookup)
+            return True
+    
+    def _cache_key(self, lookup: str):
+        """Remember a validated key, evicting the least recently used"""
+        with self._key_cache_lock:
+            self._key_cache[lookup] = time.monotonic() + Config.API_KEY_CACHE_TTL
+            self._key_cache.move_to_end(lookup)
+            while len(self._key_cache) > Config.API_KEY_CACHE_SIZE:
+                self._key_cache.popitem(last=False)
+    
+    def _check_api_key(self, api_key: str, lookup: str) -> bool:
+        """Verify an API key against the database"""
         conn = self.get_connection()
         cursor = conn.cursor()
         
-        cursor.execute('SELECT key_hash FROM api_keys WHERE is_active = TRUE')
+        cursor.execute('''
+            SELECT id, key_hash FROM api_keys WHERE key_lookup = %s AND is_active = TRUE
+        ''', (lookup,))
+        row = cursor.fetchone()
+        
+        if row is not None:
+            if hmac.compare_digest(row['key_hash'], lookup):
+                return True
+            # Legacy key still stored as a password hash
+            if check_password_hash(row['key_hash'], api_key):
+                self._enqueue('upgrade', (lookup, row['id']))
+                return True
+            return False
+        
+        # Fall back to scanning keys that predate key_lookup, upgrading on a match
+        cursor.execute('''
+            SELECT id, key_hash FROM api_keys WHERE key_lookup IS NULL AND is_active = TRUE
+        ''')
         rows = cursor.fetchall()
         
         for row in rows:
             if check_password_hash(row['key_hash'], api_key):
-                # Update last used timestamp
-                cursor.execute('''
-                    UPDATE api_keys 
-                    SET last_used = CURRENT_TIMESTAMP 
-                    WHERE key_hash = %s
-                ''', (row['key_hash'],))
-                conn.commit() # Connection will be closed at the end of the request
+                self._enqueue('upgrade', (lookup, row['id']))
                 return True
         
         return False
 
+# Explanations and fixes for known error types
+_ERROR_EXPLANATIONS = MappingProxyType({
+    "HIGH_CPU_USAGE": "CPU usage has exceeded the threshold, indicating intensive processing that may slow down the system.",
+    "HIGH_MEMORY_USAGE": "Memory usage is critically high, which can lead to system instability and slower performance.",
+    "DISK_SPACE_LOW": "Available disk space is running low, which can cause write operations to fail.",
+    "SLOW_RESPONSE": "Function execution time exceeded acceptable limits, indicating performance bottleneck.",
+    "NETWORK_ERROR": "Network connectivity issue detected, which may affect external API calls or data transfers.",
+    "DATABASE_ERROR": "Database operation failed, potentially due to connection issues or query problems.",
+    "AUTHENTICATION_ERROR": "Authentication failed, indicating potential security breach or expired credentials.",
+    "RATE_LIMIT_EXCEEDED": "Too many requests received in a short time period.",
+})
+
+_SUGGESTED_FIXES = MappingProxyType({
+    "HIGH_CPU_USAGE": "Consider optimizing algorithms, reducing computational complexity, or scaling horizontally.",
+    "HIGH_MEMORY_USAGE": "Review memory allocation, implement garbage collection, or increase available RAM.",
+    "DISK_SPACE_LOW": "Clean up temporary files, archive old logs, or expand storage capacity.",
+    "SLOW_RESPONSE": "Optimize database queries, implement caching, or consider asynchronous processing.",
+    "NETWORK_ERROR": "Check network connectivity, implement retry logic, or use circuit breaker pattern.",
+    "AUTHENTICATION_ERROR": "Verify API key is valid and has not expired.",
+    "RATE_LIMIT_EXCEEDED": "Reduce request frequency or upgrade to a higher rate limit tier.",
+})
+
 class PerformanceMonitor:
     """Core performance monitoring class"""
     
@@ -305,43 +856,99 @@ class PerformanceMonitor:
             'disk': 90.0,
             'response_time': 5.0
         }
+        
+        # Latest system metrics sample, shared by requests and the background monitor
+        self._latest_metrics: Dict[str, Any] = {}
+        self._latest_metrics_at = float('-inf')
+        self._disk_percent = 0.0
+        self._disk_sampled_at = float('-inf')
+        self._metrics_lock = threading.Lock()
+        
+        # The first non-blocking cpu_percent call only sets the reference point
+        psutil.cpu_percent(interval=None)
+        self._cpu_sampled_at = time.monotonic()
     
     def _get_system_metrics(self) -> Dict[str, Any]:
         """Get current system performance metrics"""
-        try:
-            cpu_percent = psutil.cpu_percent(interval=0.1)
-            memory = psutil.virtual_memory()
-            disk = psutil.disk_usage('/')
-            network = psutil.net_io_counters()
+        # Normally kept fresh by the background sampler
+        if time.monotonic() - self._latest_metrics_at > Config.METRICS_MAX_AGE:
+            return self._sample_system_metrics(max_age=Config.METRICS_MAX_AGE)
+        return self._latest_metrics
+    
+    def _sample_system_metrics(self, max_age: Optional[float] = None) -> Dict[str, Any]:
+        """Sample system performance metrics and cache them
+        
+        With max_age, a sample taken by another thread in the meantime is reused.
+        """
+        with self._metrics_lock:
+            now = time.monotonic()
+            if max_age is not None and now - self._latest_metrics_at <= max_age:
+                return self._latest_metrics
             
-            return {
-                'cpu_usage': cpu_percent,
-                'memory_usage': memory.percent,
-                'disk_usage': disk.percent,
-                'network_io': {
-                    'bytes_sent': network.bytes_sent,
-                    'bytes_recv': network.bytes_recv
+            try:
+                # CPU usage since the previous sample; a very short window reads as 0% or 100%
+                window = now - self._cpu_sampled_at
+                if window < Config.CPU_SAMPLE_MIN_WINDOW and 'cpu_usage' in self._latest_metrics:
+                    cpu_percent = self._latest_metrics['cpu_usage']
+                else:
+                    if window < Config.CPU_SAMPLE_MIN_WINDOW:
+                        # No earlier reading to fall back on, so wait out the window once
+                        time.sleep(Config.CPU_SAMPLE_MIN_WINDOW - window)
+                    cpu_percent = psutil.cpu_percent(interval=None)
+                    self._cpu_sampled_at = time.monotonic()
+                memory = psutil.virtual_memory()
+                network = psutil.net_io_counters()
+                
+                # Disk usage barely changes between samples
+                if now - self._disk_sampled_at > Config.DISK_USAGE_MAX_AGE:
+                    self._disk_percent = psutil.disk_usage('/').percent
+                    self._disk_sampled_at = now
+                
+                metrics = {
+                    'cpu_usage': cpu_percent,
+                    'memory_usage': memory.percent,
+                    'disk_usage': self._disk_percent,
+                    'network_io': {
+                        'bytes_sent': network.bytes_sent,
+                        'bytes_recv': network.bytes_recv
+                    }
                 }
-            }
-        except Exception as e:
-            logger.error(f"Error getting system metrics: {e}")
-            return {}
+            except Exception as e:
+                logger.error(f"Error getting system metrics: {e}")
+                metrics = {}
+            
+            self._latest_metrics = metrics
+            self._latest_metrics_at = now
+            return metrics
+    
+    def refresh_thresholds(self):
+        """Pick up thresholds updated through any worker"""
+        self.thresholds.update(self.db.load_thresholds())
     
     def log_error(self, error_type: str, message: str, function_name: str = "unknown",
-                  level: str = "ERROR", api_key: Optional[str] = None):
+                  level: str = "ERROR", api_key: Optional[str] = None,
+                  exc: Optional[BaseException] = None):
         """Log an error with detailed information"""
         
+        if exc is not None:
+            traceback_info = ''.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
+        elif sys.exc_info()[0] is not None:
+            traceback_info = traceback.format_exc()
+        else:
+            # Most logged conditions (thresholds, auth, rate limits) have no exception
+            traceback_info = None
+        
         explanation = self._generate_error_explanation(error_type, message)
         suggested_fix = self._generate_suggested_fix(error_type, message)
         performance_impact = self._calculate_performance_impact()
         
         error_log = ErrorLog(
             id=None,
-            timestamp=datetime.now().isoformat(),
+            timestamp=time.time(),
             level=level,
             error_type=error_type,
             message=message,
-            traceback_info=traceback.format_exc() if sys.exc_info()[0] else "No traceback available",
+            traceback_info=traceback_info,
             function_name=function_name,
             cpu_impact=performance_impact['cpu_impact'],
             memory_impact=performance_impact['memory_impact'],
@@ -356,30 +963,11 @@ class PerformanceMonitor:
     
     def _generate_error_explanation(self, error_type: str, message: str) -> str:
         """Generate detailed explanation for the error"""
-        explanations = {
-            "HIGH_CPU_USAGE": "CPU usage has exceeded the threshold, indicating intensive processing that may slow down the system.",
-            "HIGH_MEMORY_USAGE": "Memory usage is critically high, which can lead to system instability and slower performance.",
-            "DISK_SPACE_LOW": "Available disk space is running low, which can cause write operations to fail.",
-            "SLOW_RESPONSE": "Function execution time exceeded acceptable limits, indicating performance bottleneck.",
-            "NETWORK_ERROR": "Network connectivity issue detected, which may affect external API calls or data transfers.",
-            "DATABASE_ERROR": "Database operation failed, potentially due to connection issues or query problems.",
-            "AUTHENTICATION_ERROR": "Authentication failed, indicating potential security breach or expired credentials.",
-            "RATE_LIMIT_EXCEEDED": "Too many requests received in a short time period.",
-        }
-        return explanations.get(error_type, f"An error of type '{error_type}' occurred: {message}")
+        return _ERROR_EXPLANATIONS.get(error_type, f"An error of type '{error_type}' occurred: {message}")
     
     def _generate_suggested_fix(self, error_type: str, message: str) -> str:
         """Generate suggested fixes for the error"""
-        fixes = {
-            "HIGH_CPU_USAGE": "Consider optimizing algorithms, reducing computational complexity, or scaling horizontally.",
-            "HIGH_MEMORY_USAGE": "Review memory allocation, implement garbage collection, or increase available RAM.",
-            "DISK_SPACE_LOW": "Clean up temporary files, archive old logs, or expand storage capacity.",
-            "SLOW_RESPONSE": "Optimize database queries, implement caching, or consider asynchronous processing.",
-            "NETWORK_ERROR": "Check network connectivity, implement retry logic, or use circuit breaker pattern.",
-            "AUTHENTICATION_ERROR": "Verify API key is valid and has not expired.",
-            "RATE_LIMIT_EXCEEDED": "Reduce request frequency or upgrade to a higher rate limit tier.",
-        }
-        return fixes.get(error_type, f"Review the error details and implement appropriate error handling for '{error_type}'.")
+        return _SUGGESTED_FIXES.get(error_type, f"Review the error details and implement appropriate error handling for '{error_type}'.")
     
     def _calculate_performance_impact(self) -> Dict[str, float]:
         """Calculate performance impact of the current error"""
@@ -390,14 +978,54 @@ class PerformanceMonitor:
             'overall_severity': min(10, (metrics.get('cpu_usage', 0) + metrics.get('memory_usage', 0)) / 20)
         }
     
+    def record_execution(self, function_name: str, execution_time: float,
+                         api_key: Optional[str] = None):
+        """Check thresholds and save metrics for a finished function call"""
+        end_metrics = self._get_system_metrics()
+        
+        # Check thresholds
+        if end_metrics.get('cpu_usage', 0) > self.thresholds['cpu']:
+            self.log_error(
+                "HIGH_CPU_USAGE",
+                f"CPU usage: {end_metrics['cpu_usage']:.2f}% exceeds threshold",
+                function_name,
+                level="WARNING",
+                api_key=api_key
+            )
+        
+        if execution_time > self.thresholds['response_time']:
+            self.log_error(
+                "SLOW_RESPONSE",
+                f"Execution time: {execution_time:.2f}s exceeds threshold",
+                function_name,
+                level="WARNING",
+                api_key=api_key
+            )
+        
+        # Save metrics
+        metric = PerformanceMetrics(
+            id=None,
+            timestamp=time.time(),
+            cpu_usage=end_metrics.get('cpu_usage', 0),
+            memory_usage=end_metrics.get('memory_usage', 0),
+            disk_usage=end_metrics.get('disk_usage', 0),
+            network_sent=end_metrics.get('network_io', {}).get('bytes_sent', 0),
+            network_recv=end_metrics.get('network_io', {}).get('bytes_recv', 0),
+            execution_time=execution_time,
+            function_name=function_name,
+            status="completed",
+            api_key=api_key
+        )
+        
+        self.db.save_metric(metric)
+    
     def monitor_function(self, function_name: str, api_key: Optional[str] = None):
         """Decorator for monitoring function performance"""
         from contextlib import contextmanager
         
         @contextmanager
         def _monitor():
-            start_time = time.time()
-            start_metrics = self._get_system_metrics()
+            start_time = time.perf_counter()
             
             try:
                 yield
@@ -406,55 +1034,40 @@ class PerformanceMonitor:
                     error_type=type(e).__name__.upper(),
                     message=str(e),
                     function_name=function_name,
-                    api_key=api_key
+                    api_key=api_key,
+                    exc=e
                 )
                 raise
             finally:
-                end_time = time.time()
-                execution_time = end_time - start_time
-                end_metrics = self._get_system_metrics()
-                
-                # Check thresholds
-                if end_metrics.get('cpu_usage', 0) > self.thresholds['cpu']:
-                    self.log_error(
-                        "HIGH_CPU_USAGE",
-                        f"CPU usage: {end_metrics['cpu_usage']:.2f}% exceeds threshold",
-                        function_name,
-                        level="WARNING",
-                        api_key=api_key
-                    )
-                
-                if execution_time > self.thresholds['response_time']:
-                    self.log_error(
-                        "SLOW_RESPONSE",
-                        f"Execution time: {execution_time:.2f}s exceeds threshold",
-                        function_name,
-                        level="WARNING",
-                        api_key=api_key
-                    )
-                
-                # Save metrics
-                metric = PerformanceMetrics(
-                    id=None,
-                    timestamp=datetime.now().isoformat(),
-                    cpu_usage=end_metrics.get('cpu_usage', 0),
-                    memory_usage=end_metrics.get('memory_usage', 0),
-                    disk_usage=end_metrics.get('disk_usage', 0),
-                    network_sent=end_metrics.get('network_io', {}).get('bytes_sent', 0),
-                    network_recv=end_metrics.get('network_io', {}).get('bytes_recv', 0),
-                    execution_time=execution_time,
-                    function_name=function_name,
-                    status="completed",
-                    api_key=api_key
-                )
-                
-                self.db.save_metric(metric)
+                self.record_execution(function_name, time.perf_counter() - start_time, api_key)
         
         return _monitor()
 
+class OrjsonProvider(JSONProvider):
+    """Flask JSON provider backed by orjson"""
+    
+    option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS if orjson else 0
+    
+    def _dumps(self, obj: Any) -> bytes:
+        # Types orjson doesn't know (e.g. Decimal) are handled like Flask does
+        return orjson.dumps(obj, default=DefaultJSONProvider.default, option=self.option)
+    
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return self._dumps(obj).decode()
+    
+    def loads(self, s, **kwargs: Any) -> Any:
+        return orjson.loads(s)
+    
+    def response(self, *args: Any, **kwargs: Any):
+        # Skip the str round-trip and hand the encoded bytes straight to the response
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self._dumps(obj), mimetype='application/json')
+
 # Initialize Flask app
 app = Flask(__name__)
 app.config.from_object(Config)
+if orjson is not None:
+    app.json = OrjsonProvider(app)
 
 # Enable CORS
 CORS(app, resources={
@@ -465,35 +1078,160 @@ CORS(app, resources={
     }
 })
 
+class ShardedMemoryStorage(Storage):
+    """In-memory rate limit storage split across independently locked shards"""
+    
+    # Registered with limits, so it can be selected with storage_uri="memorysharded://"
+    STORAGE_SCHEME = ["memorysharded"]
+    SHARDS = 64
+    # Expired counters are dropped once a shard holds more keys than this
+    PURGE_THRESHOLD = 1024
+    
+    def __init__(self, uri: Optional[str] = None, **options):
+        super().__init__(uri, **options)
+        # Each shard maps key -> (count, window expiry)
+        self._shards = [(threading.Lock(), {}) for _ in range(self.SHARDS)]
+    
+    @property
+    def base_exceptions(self):
+        return ValueError
+    
+    def _shard(self, key: str):
+        return self._shards[hash(key) & (self.SHARDS - 1)]
+    
+    def incr(self, key: str, expiry: int, elastic_expiry: bool = False, amount: int = 1) -> int:
+        lock, counters = self._shard(key)
+        now = time.time()
+        
+        with lock:
+            count, expires = counters.get(key, (0, 0.0))
+            if expires <= now:
+                # Start a new window
+                if len(counters) > self.PURGE_THRESHOLD:
+                    for stale in [k for k, (_, e) in counters.items() if e <= now]:
+                        del counters[stale]
+                count, expires = 0, now + expiry
+            elif elastic_expiry:
+                expires = now + expiry
+            
+            count += amount
+            counters[key] = (count, expires)
+        
+        return count
+    
+    def get(self, key: str) -> int:
+        lock, counters = self._shard(key)
+        with lock:
+            count, expires = counters.get(key, (0, 0.0))
+        return count if expires > time.time() else 0
+    
+    def get_expiry(self, key: str) -> int:
+        lock, counters = self._shard(key)
+        now = time.time()
+        with lock:
+            _, expires = counters.get(key, (0, 0.0))
+        return int(expires if expires > now else now)
+    
+    def check(self) -> bool:
+        return True
+    
+    def reset(self) -> Optional[int]:
+        cleared = 0
+        for lock, counters in self._shards:
+            with lock:
+                cleared += len(counters)
+                counters.clear()
+        return cleared
+    
+    def clear(self, key: str) -> None:
+        lock, counters = self._shard(key)
+        with lock:
+            counters.pop(key, None)
+
 # Rate limiting
 limiter = Limiter(
     app=app,
     key_func=get_remote_address,
     default_limits=[Config.RATE_LIMIT],
-    storage_uri="memory://"
+    storage_uri=Config.RATE_LIMIT_STORAGE_URI
 )
 
 # Initialize monitor
 monitor = PerformanceMonitor()
 
-# Close DB connection at the end of each request
+# Return DB connection to the pool at the end of each request
 @app.teardown_appcontext
 def teardown_db(exception):
     db = g.pop('db_conn', None)
     if db is not None:
-        db.close()
+        monitor.db.release_connection(db)
+
+# Don't lose queued writes on shutdown
+atexit.register(monitor.db.flush)
+
+# Short-lived cache for history queries, which dashboards tend to poll
+response_cache = TTLCache(maxsize=Config.RESPONSE_CACHE_SIZE, ttl=Config.RESPONSE_CACHE_TTL)
+response_cache_lock = threading.RLock()
+
+def cached_query(key: tuple, loader):
+    """Return a recent result for key, calling loader on a miss"""
+    with response_cache_lock:
+        result = response_cache.get(key)
+    
+    if result is None:
+        result = loader()
+        with response_cache_lock:
+            response_cache[key] = result
+    
+    return result
+
+def embed_json(encoded: Dict[str, str], **fields):
+    """Build a JSON object response from already-encoded values plus regular fields"""
+    parts = [f'{app.json.dumps(key)}:{value}' for key, value in encoded.items()]
+    parts += [f'{app.json.dumps(key)}:{app.json.dumps(value)}' for key, value in fields.items()]
+    return app.response_class('{' + ','.join(parts) + '}', mimetype='application/json')
+
+def history_args(default_limit: int):
+    """Parse limit and before_id query parameters, or return None if either is invalid"""
+    limit = request.args.get('limit', default_limit, type=int)
+    before_id = request.args.get('before_id', None, type=int)
+    if limit < 0 or (before_id is not None and before_id < 1):
+        return None
+    return limit, before_id
 
-# Authentication decorator
+def cacheable(response):
+    """Let the client reuse a response for as long as the server would"""
+    # Private, since responses are specific to the caller's API key
+    response.headers['Cache-Control'] = f'private, max-age={int(Config.RESPONSE_CACHE_TTL)}'
+    return response
+
+# Endpoint markers, applied per request by the hooks below
 def require_api_key(f):
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
+    """Require a valid X-API-Key header for this endpoint"""
+    f.requires_api_key = True
+    return f
+
+def monitored(f):
+    """Record performance metrics for this endpoint"""
+    f.monitored = True
+    return f
+
+@app.before_request
+def authenticate_request():
+    """Validate the API key and start timing before the endpoint runs"""
+    view = app.view_functions.get(request.endpoint)
+    # Unknown routes and CORS preflights pass straight through
+    if view is None or request.method == 'OPTIONS':
+        return None
+    
+    if getattr(view, 'requires_api_key', False):
         api_key = request.headers.get('X-API-Key')
         
         if not api_key:
             monitor.log_error(
                 "AUTHENTICATION_ERROR",
                 "Missing API key",
-                f.__name__,
+                request.endpoint,
                 level="WARNING"
             )
             return jsonify({'error': 'API key required'}), 401
@@ -502,15 +1240,25 @@ def require_api_key(f):
             monitor.log_error(
                 "AUTHENTICATION_ERROR",
                 "Invalid API key",
-                f.__name__,
+                request.endpoint,
                 level="WARNING"
             )
             return jsonify({'error': 'Invalid API key'}), 401
         
         g.api_key = api_key
-        return f(*args, **kwargs)
     
-    return decorated_function
+    if getattr(view, 'monitored', False):
+        g.start_time = time.perf_counter()
+    
+    return None
+
+@app.after_request
+def record_request_metrics(response):
+    """Save performance metrics for monitored endpoints"""
+    start_time = g.pop('start_time', None)
+    if start_time is not None:
+        monitor.record_execution(request.endpoint, time.perf_counter() - start_time, g.get('api_key'))
+    return response
 
 # API Routes
 @app.route('/api/health', methods=['GET'])
@@ -518,21 +1266,29 @@ def health_check():
     """Health check endpoint - no auth required"""
     return jsonify({
         'status': 'healthy',
-        'timestamp': datetime.now().isoformat(),
+        'timestamp': iso_now(),
         'version': '2.0'
     })
 
+@app.route('/metrics', methods=['GET'])
+@limiter.exempt
+def prometheus_metrics():
+    """Prometheus scrape endpoint - no auth required"""
+    if not prometheus_client:
+        return jsonify({'error': 'Endpoint not found'}), 404
+    return prometheus_client.generate_latest(), 200, {'Content-Type': prometheus_client.CONTENT_TYPE_LATEST}
+
 @app.route('/api/metrics', methods=['GET'])
 @require_api_key
+@monitored
 @limiter.limit("60 per minute")
 def get_metrics():
     """Get current system metrics"""
-    with monitor.monitor_function('get_metrics', g.api_key):
-        metrics = monitor._get_system_metrics()
-        return jsonify({
-            'metrics': metrics,
-            'timestamp': datetime.now().isoformat()
-        })
+    metrics = monitor._get_system_metrics()
+    return jsonify({
+        'metrics': metrics,
+        'timestamp': iso_now()
+    })
 
 @app.route('/api/errors', methods=['GET'])
 @require_api_key
@@ -540,54 +1296,69 @@ def get_metrics():
 def get_errors():
     """Get error history"""
     try:
-        limit = request.args.get('limit', 50, type=int)
+        args = history_args(50)
+        if args is None:
+            return jsonify({'error': 'limit and before_id must be positive'}), 400
+        limit, before_id = args
         level = request.args.get('level', None)
         
-        errors = monitor.db.get_errors(limit=limit, level=level, api_key=g.api_key)
+        errors_json, count = cached_query(
+            ('errors', g.api_key, limit, level, before_id),
+            lambda: monitor.db.get_errors_json(limit=limit, level=level, api_key=g.api_key, before_id=before_id)
+        )
         
-        return jsonify({
-            'errors': errors,
-            'total_count': len(errors),
-            'timestamp': datetime.now().isoformat()
-        })
+        return cacheable(embed_json(
+            {'errors': errors_json},
+            total_count=count,
+            timestamp=iso_now()
+        ))
     except Exception as e:
         monitor.log_error("API_ERROR", str(e), "get_errors", api_key=g.api_key)
         return jsonify({'error': 'Failed to retrieve errors'}), 500
 
 @app.route('/api/performance', methods=['GET'])
 @require_api_key
+@monitored
 @limiter.limit("60 per minute")
 def get_performance_history():
     """Get performance metrics history"""
-    with monitor.monitor_function('get_performance_history', g.api_key):
-        limit = request.args.get('limit', 100, type=int)
-        metrics = monitor.db.get_metrics(limit=limit, api_key=g.api_key)
-        
-        return jsonify({
-            'metrics': metrics,
-            'total_count': len(metrics),
-            'timestamp': datetime.now().isoformat()
-        })
+    args = history_args(100)
+    if args is None:
+        return jsonify({'error': 'limit and before_id must be positive'}), 400
+    limit, before_id = args
+    
+    metrics_json, count = cached_query(
+        ('performance', g.api_key, limit, before_id),
+        lambda: monitor.db.get_metrics_json(limit=limit, api_key=g.api_key, before_id=before_id)
+    )
+    
+    return cacheable(embed_json(
+        {'metrics': metrics_json},
+        total_count=count,
+        timestamp=iso_now()
+    ))
 
 @app.route('/api/thresholds', methods=['GET', 'POST'])
 @require_api_key
+@monitored
 def manage_thresholds():
     """Get or update performance thresholds"""
-    with monitor.monitor_function('manage_thresholds', g.api_key):
-        if request.method == 'GET':
-            return jsonify(monitor.thresholds)
-        
-        elif request.method == 'POST':
-            try:
-                new_thresholds = request.json
-                monitor.thresholds.update(new_thresholds)
-                return jsonify({
-                    'message': 'Thresholds updated successfully',
-                    'thresholds': monitor.thresholds
-                })
-            except Exception as e:
-                monitor.log_error("THRESHOLD_UPDATE_ERROR", str(e), "manage_thresholds", api_key=g.api_key)
-                return jsonify({'error': 'Failed to update thresholds'}), 400
+    if request.method == 'GET':
+        return jsonify(monitor.thresholds)
+    
+    elif request.method == 'POST':
+        try:
+            new_thresholds = {name: float(value) for name, value in request.json.items()}
+            # Other workers pick the change up on their next refresh
+            monitor.db.save_thresholds(new_thresholds)
+            monitor.thresholds.update(new_thresholds)
+            return jsonify({
+                'message': 'Thresholds updated successfully',
+                'thresholds': monitor.thresholds
+            })
+        except Exception as e:
+            monitor.log_error("THRESHOLD_UPDATE_ERROR", str(e), "manage_thresholds", api_key=g.api_key)
+            return jsonify({'error': 'Failed to update thresholds'}), 400
 
 @app.route('/api/test-error', methods=['POST'])
 @require_api_key
@@ -604,34 +1375,45 @@ def test_error():
         monitor.log_error("TEST_ERROR_FAILURE", str(e), "test_error", api_key=g.api_key)
         return jsonify({'error': 'Failed to log test error'}), 500
 
+# Load simulations run in a separate process so they never hold this worker's GIL
+_load_pool: Optional[ProcessPoolExecutor] = None
+_load_pool_lock = threading.Lock()
+
+def get_load_pool() -> ProcessPoolExecutor:
+    """Get the load simulation process pool, creating it on first use"""
+    global _load_pool
+    with _load_pool_lock:
+        if _load_pool is None:
+            # Forking this multi-threaded worker could copy locks held by its other
+            # threads into the child, so start children from a clean server process
+            _load_pool = ProcessPoolExecutor(
+                max_workers=1,
+                mp_context=multiprocessing.get_context('forkserver')
+            )
+        return _load_pool
+
 @app.route('/api/simulate-load', methods=['POST'])
 @require_api_key
+@monitored
 @limiter.limit("10 per hour")
 def simulate_load():
     """Simulate high load to test monitoring"""
-    with monitor.monitor_function('simulate_load', g.api_key):
-        try:
-            duration = min(request.json.get('duration', 5), 10)  # Max 10 seconds
-            cpu_intensive = request.json.get('cpu_intensive', True)
-            
-            start_time = time.time()
-            data = []
-            
-            while time.time() - start_time < duration:
-                if cpu_intensive:
-                    [x**2 for x in range(10000)]
-                else:
-                    data.extend(range(100000))
-                time.sleep(0.01)
-            
-            return jsonify({
-                'message': 'Load simulation completed',
-                'duration': duration,
-                'type': 'cpu_intensive' if cpu_intensive else 'memory_intensive'
-            })
-        except Exception as e:
-            monitor.log_error("LOAD_SIMULATION_ERROR", str(e), "simulate_load", api_key=g.api_key)
-            return jsonify({'error': 'Load simulation failed'}), 500
+    try:
+        duration = min(request.json.get('duration', 5), 10)  # Max 10 seconds
+        cpu_intensive = request.json.get('cpu_intensive', True)
+        
+        # Wait without the GIL while the load runs, allowing for queued simulations
+        future = get_load_pool().submit(load_kernel, duration, cpu_intensive)
+        future.result(timeout=duration + 30)
+        
+        return jsonify({
+            'message': 'Load simulation completed',
+            'duration': duration,
+            'type': 'cpu_intensive' if cpu_intensive else 'memory_intensive'
+        })
+    except Exception as e:
+        monitor.log_error("LOAD_SIMULATION_ERROR", str(e), "simulate_load", api_key=g.api_key)
+        return jsonify({'error': 'Load simulation failed'}), 500
 
 @app.errorhandler(429)
 def ratelimit_handler(e):
@@ -644,36 +1426,77 @@ def not_found(error):
 
 @app.errorhandler(500)
 def internal_error(error):
+    # Unhandled endpoint exceptions arrive here wrapped in the 500 error
+    original = getattr(error, 'original_exception', None)
+    if original is not None:
+        monitor.log_error(
+            error_type=type(original).__name__.upper(),
+            message=str(original),
+            function_name=request.endpoint or "flask_app",
+            api_key=g.get('api_key'),
+            exc=original
+        )
     monitor.log_error("INTERNAL_SERVER_ERROR", str(error), "flask_app")
     return jsonify({'error': 'Internal server error'}), 500
 
 # Background monitoring
+def check_thresholds():
+    """Log warnings when system-wide usage exceeds the thresholds"""
+    metrics = monitor._get_system_metrics()
+    
+    if metrics.get('cpu_usage', 0) > monitor.thresholds['cpu']:
+        monitor.log_error(
+            "HIGH_CPU_USAGE",
+            f"System CPU: {metrics['cpu_usage']:.2f}%",
+            "background_monitor",
+            level="WARNING"
+        )
+    
+    if metrics.get('memory_usage', 0) > monitor.thresholds['memory']:
+        monitor.log_error(
+            "HIGH_MEMORY_USAGE",
+            f"System Memory: {metrics['memory_usage']:.2f}%",
+            "background_monitor",
+            level="WARNING"
+        )
+
 def background_monitoring():
     """Background thread for continuous monitoring"""
-    while True:
-        try:
-            metrics = monitor._get_system_metrics()
-            
-            if metrics.get('cpu_usage', 0) > monitor.thresholds['cpu']:
-                monitor.log_error(
-                    "HIGH_CPU_USAGE",
-                    f"System CPU: {metrics['cpu_usage']:.2f}%",
-                    "background_monitor",
-                    level="WARNING"
-                )
-            
-            if metrics.get('memory_usage', 0) > monitor.thresholds['memory']:
-                monitor.log_error(
-                    "HIGH_MEMORY_USAGE",
-                    f"System Memory: {metrics['memory_usage']:.2f}%",
-                    "background_monitor",
-                    level="WARNING"
-                )
-            
-            time.sleep(30)
-        except Exception as e:
-            monitor.log_error("BACKGROUND_MONITOR_ERROR", str(e), "background_monitoring")
-            time.sleep(60)
+    scheduler = sched.scheduler(time.monotonic, time.sleep)
+    
+    def every(interval: float, task):
+        def run(due: float):
+            try:
+                task()
+            except Exception as e:
+                monitor.log_error("BACKGROUND_MONITOR_ERROR", str(e), "background_monitoring")
+            # Keep to the original cadence, skipping runs missed while busy
+            next_due = max(due + interval, time.monotonic())
+            scheduler.enterabs(next_due, 1, run, (next_due,))
+        
+        first_due = time.monotonic() + interval
+        scheduler.enterabs(first_due, 1, run, (first_due,))
+    
+    def leader_only(task):
+        # System-wide checks and cleanup would otherwise run once per worker
+        def run():
+            if monitor.db.is_monitor_leader():
+                task()
+        return run
+    
+    # Each task runs on its own interval; the thread sleeps until the next one is due
+    every(Config.MONITOR_SAMPLE_INTERVAL, monitor._sample_system_metrics)
+    every(Config.MONITOR_CHECK_INTERVAL, monitor.refresh_thresholds)
+    every(Config.MONITOR_CHECK_INTERVAL, leader_only(check_thresholds))
+    every(Config.CLEANUP_INTERVAL, leader_only(monitor.db.cleanup_old_metrics))
+    
+    scheduler.run()
+
+def start_background_monitoring() -> threading.Thread:
+    """Start the background monitoring thread for this process"""
+    monitoring_thread = threading.Thread(target=background_monitoring, daemon=True)
+    monitoring_thread.start()
+    return monitoring_thread
 
 if __name__ == '__main__':
     print("=" * 60)
@@ -709,12 +1532,12 @@ if __name__ == '__main__':
     print("\n🚀 Starting services...")
     
     # Start background monitoring
-    monitoring_thread = threading.Thread(target=background_monitoring, daemon=True)
-    monitoring_thread.start()
+    start_background_monitoring()
     print("  ✓ Background monitoring started")
     
     # Start Flask app
     print("  ✓ API server starting on http://0.0.0.0:5000")
     print("=" * 60)
     
-    app.run(host='0.0.0.0', port=5000, debug=Config.DEBUG)
\ No newline at end of file
+    # Development server only; production runs under gunicorn with gthread workers
+    app.run(host='0.0.0.0', port=5000, debug=Config.DEBUG, threaded=True)
\ No newline at end of file
@@ -0,0 +1,12 @@
+"""
+Gunicorn configuration
+Loaded automatically when gunicorn is started from the project root
+"""
+
+
+def post_worker_init(worker):
+    """Start background monitoring in each worker once the app is loaded"""
+    # Every worker samples metrics; the worker holding the monitor advisory
+    # lock also checks thresholds and cleans up old metrics
+    from enhanced_monitor_api import start_background_monitoring
+    start_background_monitoring()
@@ -0,0 +1,22 @@
+"""
+Load simulation kernel for /api/simulate-load
+Kept free of app imports so worker processes start without the Flask app,
+its database connections or its background threads
+"""
+
+import time
+import numpy as np
+
+
+def load_kernel(duration: float, cpu_intensive: bool):
+    """Generate CPU or memory load for the given number of seconds"""
+    start_time = time.time()
+    data = []
+    matrix = np.random.default_rng().random((300, 300))
+    
+    while time.time() - start_time < duration:
+        if cpu_intensive:
+            matrix @ matrix
+        else:
+            data.append(np.arange(100000, dtype=np.int64))
+        time.sleep(0.01)
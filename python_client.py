@@ -4,6 +4,7 @@ Easy-to-use Python client for the Performance Monitoring API
 
 Installation:
     pip install requests
+    pip install "httpx[http2]"  # optional, for AsyncPerformanceMonitorClient
 
 Usage:
     from monitor_client import PerformanceMonitorClient
@@ -24,17 +25,74 @@ Usage:
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib3.exceptions import MaxRetryError, ProtocolError, ReadTimeoutError
 import time
+import atexit
+import importlib.util
 import functools
-from typing import Dict, List, Optional, Any
+import threading
+import queue
+from collections import OrderedDict, Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Any, Iterable, Iterator
 from datetime import datetime
-from contextlib import contextmanager
+from contextlib import contextmanager, asynccontextmanager
+
+# Monotonic timer for monitor_function, bound once to skip the attribute lookup
+_perf_counter_ns = time.perf_counter_ns
+
+try:
+    import httpx
+except ImportError:  # Only needed for AsyncPerformanceMonitorClient
+    httpx = None
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:  # Fall back to the stdlib parser
+    import json
+    _loads = json.loads
+
+# urllib3 can only decode brotli responses with one of these installed
+if importlib.util.find_spec('brotli') or importlib.util.find_spec('brotlicffi'):
+    _ACCEPT_ENCODING = 'gzip, deflate, br'
+else:
+    _ACCEPT_ENCODING = 'gzip, deflate'
+
+
+class APIError(Exception):
+    """Error response from the API, carrying its HTTP status code"""
+    
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class _RetryPolicy(Retry):
+    """Retry that only replays POSTs when the server didn't process them"""
+    
+    # 429 and 503 are rejected before the request is handled; other 5xx may
+    # come after a load simulation ran or an error was logged
+    POST_RETRY_STATUSES = frozenset([429, 503])
+    
+    def is_retry(self, method: str, status_code: int, has_retry_after: bool = False) -> bool:
+        if method.upper() == 'POST' and status_code not in self.POST_RETRY_STATUSES:
+            return False
+        return super().is_retry(method, status_code, has_retry_after)
+    
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        # A POST that timed out or dropped mid-response may already have been handled
+        if method and method.upper() == 'POST' and isinstance(error, (ReadTimeoutError, ProtocolError)):
+            raise error.with_traceback(_stacktrace)
+        return super().increment(method, url, response, error, _pool, _stacktrace)
 
 
 class PerformanceMonitorClient:
     """Client for Performance Monitoring API"""
     
-    def __init__(self, api_url: str, api_key: str, timeout: int = 30):
+    def __init__(self, api_url: str, api_key: str, timeout: int = 30, use_batch: bool = False):
         """
         Initialize the client
         
@@ -42,6 +100,7 @@ class PerformanceMonitorClient:
             api_url: Base URL of the monitoring API (e.g., https://your-api.onrender.com)
             api_key: Your API key
             timeout: Request timeout in seconds (default: 30)
+            use_batch: Try the /api/batch endpoint in get_dashboard_snapshot (default: False)
         """
         self.api_url = api_url.rstrip('/')
         self.api_key = api_key
@@ -49,8 +108,50 @@ class PerformanceMonitorClient:
         self.session = requests.Session()
         self.session.headers.update({
             'X-API-Key': api_key,
-            'Content-Type': 'application/json'
+            'Content-Type': 'application/json',
+            'Accept-Encoding': _ACCEPT_ENCODING
         })
+        
+        # Keep enough connections alive for concurrent callers, and back off
+        # on rate limits and server errors at the transport level
+        adapter = HTTPAdapter(
+            pool_connections=32,
+            pool_maxsize=64,
+            max_retries=_RetryPolicy(
+                total=5,
+                backoff_factor=0.3,
+                status_forcelist=(429, 500, 502, 503, 504),
+                allowed_methods=frozenset(['GET', 'POST']),
+                respect_retry_after_header=True,
+                raise_on_status=False
+            )
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        
+        # Cleared once the server is known not to have /api/batch
+        self._use_batch = use_batch
+        
+        # Wrappers built by monitor_decorator, reused for repeated decoration.
+        # Bounded rather than weak: each wrapper holds a reference to its function
+        self._wrap = functools.lru_cache(maxsize=256)(self._build_wrapper)
+        
+        # Errors caught by monitor_function are sent from a background thread,
+        # created on first use
+        self._err_queue: Optional[queue.Queue] = None
+        self._err_lock = threading.Lock()
+        
+        # Recent GET responses, keyed by (endpoint, params) in LRU order
+        self._cache: OrderedDict = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._cache_size = 256
+        # Bumped on invalidation, so responses to GETs sent before it aren't cached
+        self._cache_generation = 0
+        self._ttls = {
+            '/api/metrics': 2.0,
+            '/api/thresholds': 60.0,
+            '/api/performance': 5.0
+        }
     
     def _make_request(self, method: str, endpoint: str, **kwargs) -> Dict:
         """
@@ -67,6 +168,43 @@ class PerformanceMonitorClient:
         Raises:
             Exception: If request fails
         """
+        ttl = self._ttls.get(endpoint) if method == 'GET' else None
+        if ttl:
+            key = (endpoint, tuple(sorted((kwargs.get('params') or {}).items())))
+            with self._cache_lock:
+                cached = self._cache.get(key)
+                if cached and time.monotonic() - cached[0] < ttl:
+                    self._cache.move_to_end(key)
+                    # The raw body is cached, so every caller gets its own parsed copy
+                    return self._parse(cached[1])
+                generation = self._cache_generation
+        
+        content = self._send_raw(method, endpoint, **kwargs)
+        
+        if ttl:
+            with self._cache_lock:
+                if generation == self._cache_generation:
+                    self._cache[key] = (time.monotonic(), content)
+                    self._cache.move_to_end(key)
+                    while len(self._cache) > self._cache_size:
+                        self._cache.popitem(last=False)
+        
+        return self._parse(content)
+    
+    def _send_request(self, method: str, endpoint: str, **kwargs) -> Dict:
+        """Send a request to the API, bypassing the response cache"""
+        return self._parse(self._send_raw(method, endpoint, **kwargs))
+    
+    @staticmethod
+    def _parse(content: bytes) -> Dict:
+        """Decode a response body"""
+        try:
+            return _loads(content)
+        except ValueError as e:
+            raise Exception(f"Request failed: {str(e)}")
+    
+    def _send_raw(self, method: str, endpoint: str, **kwargs) -> bytes:
+        """Send a request to the API and return the raw response body"""
         url = f"{self.api_url}{endpoint}"
         
         try:
@@ -77,25 +215,84 @@ class PerformanceMonitorClient:
                 **kwargs
             )
             response.raise_for_status()
-            return response.json()
+            return response.content
         
         except requests.exceptions.HTTPError as e:
             if e.response.status_code == 401:
-                raise Exception(f"Authentication failed. Check your API key.")
-            elif e.response.status_code == 429:
-                raise Exception(f"Rate limit exceeded. Please slow down your requests.")
+                raise APIError(f"Authentication failed. Check your API key.", 401)
             else:
-                raise Exception(f"HTTP {e.response.status_code}: {e.response.text}")
+                raise APIError(f"HTTP {e.response.status_code}: {e.response.text}", e.response.status_code)
         
         except requests.exceptions.Timeout:
             raise Exception(f"Request timed out after {self.timeout} seconds")
         
-        except requests.exceptions.ConnectionError:
+        except requests.exceptions.ConnectionError as e:
+            # Read timeouts that used up every retry arrive wrapped as connection errors
+            reason = e.args[0] if e.args else None
+            if isinstance(reason, MaxRetryError) and isinstance(reason.reason, ReadTimeoutError):
+                raise Exception(f"Request timed out after {self.timeout} seconds")
             raise Exception(f"Failed to connect to {self.api_url}. Check URL and network.")
         
         except Exception as e:
             raise Exception(f"Request failed: {str(e)}")
     
+    def _queue_error(self, error_type: str, message: str):
+        """Queue an error for the background sender without blocking"""
+        if self._err_queue is None:
+            with self._err_lock:
+                if self._err_queue is None:
+                    self._err_queue = queue.Queue(maxsize=1024)
+                    threading.Thread(target=self._drain_errors, daemon=True).start()
+                    # The sender is a daemon thread, so give it a chance to report
+                    # errors that end the program
+                    atexit.register(self.flush_errors)
+        
+        try:
+            self._err_queue.put_nowait({'type': error_type, 'message': message})
+        except queue.Full:
+            pass  # Drop rather than stall the caller
+    
+    def _drain_errors(self):
+        """Send queued errors over the shared keep-alive session"""
+        while True:
+            item = self._err_queue.get()
+            
+            # flush_errors queues an Event to find out when everything before it was sent
+            if isinstance(item, threading.Event):
+                item.set()
+                continue
+            
+            try:
+                self._make_request('POST', '/api/test-error', json=item)
+            except Exception:
+                pass  # Don't fail if error logging fails
+    
+    def flush_errors(self, timeout: float = 5.0) -> bool:
+        """
+        Wait for queued errors to be sent
+        
+        Args:
+            timeout: Maximum seconds to wait (default: 5)
+        
+        Returns:
+            True if every queued error was sent in time
+        """
+        if self._err_queue is None:
+            return True
+        
+        deadline = time.monotonic() + timeout
+        done = threading.Event()
+        try:
+            self._err_queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(max(deadline - time.monotonic(), 0))
+    
+    def close(self, timeout: float = 5.0):
+        """Wait up to timeout seconds for queued errors to be sent, then close the session"""
+        self.flush_errors(timeout)
+        self.session.close()
+    
     def health_check(self) -> Dict:
         """
         Check API health status
@@ -103,12 +300,15 @@ class PerformanceMonitorClient:
         Returns:
             Health status dictionary
         """
-        # Health check doesn't require API key
-        response = requests.get(
+        # Health check doesn't require API key, so drop it for this call
+        # while still reusing the session's pooled connection
+        response = self.session.get(
             f"{self.api_url}/api/health",
+            headers={'X-API-Key': None},
             timeout=self.timeout
         )
-        return response.json()
+        response.raise_for_status()
+        return _loads(response.content)
     
     def get_metrics(self) -> Dict:
         """
@@ -149,6 +349,50 @@ class PerformanceMonitorClient:
         params = {'limit': limit}
         return self._make_request('GET', '/api/performance', params=params)
     
+    def iter_performance_history(self, page_size: int = 500) -> Iterator[Dict]:
+        """
+        Iterate over the full performance metrics history, newest first
+        
+        Records are fetched one page at a time, so memory use is bounded by
+        page_size however long the history is.
+        
+        Args:
+            page_size: Number of records per request (default: 500)
+        
+        Yields:
+            Metric dictionaries
+        """
+        params = {'limit': page_size}
+        while True:
+            # Bypass the response cache, which would otherwise hold on to every page
+            page = self._send_request('GET', '/api/performance', params=params)['metrics']
+            yield from page
+            if len(page) < page_size:
+                break
+            # Continue below the oldest id seen, so new records don't shift pages
+            params['before_id'] = page[-1]['id']
+    
+    def iter_errors(self, page_size: int = 500, level: Optional[str] = None) -> Iterator[Dict]:
+        """
+        Iterate over the full error history, newest first
+        
+        Args:
+            page_size: Number of errors per request (default: 500)
+            level: Filter by error level (ERROR, WARNING, INFO)
+        
+        Yields:
+            Error dictionaries
+        """
+        params = {'limit': page_size}
+        if level:
+            params['level'] = level
+        while True:
+            page = self._send_request('GET', '/api/errors', params=params)['errors']
+            yield from page
+            if len(page) < page_size:
+                break
+            params['before_id'] = page[-1]['id']
+    
     def get_thresholds(self) -> Dict:
         """
         Get current performance thresholds
@@ -169,7 +413,56 @@ class PerformanceMonitorClient:
         Returns:
             Updated thresholds
         """
-        return self._make_request('POST', '/api/thresholds', json=thresholds)
+        try:
+            return self._make_request('POST', '/api/thresholds', json=thresholds)
+        finally:
+            # Drop cached thresholds once the update has landed (or may have)
+            with self._cache_lock:
+                for key in [key for key in self._cache if key[0] == '/api/thresholds']:
+                    del self._cache[key]
+                self._cache_generation += 1
+    
+    def get_dashboard_snapshot(self, errors_limit: int = 50, perf_limit: int = 100) -> Dict:
+        """
+        Get health, metrics, errors and performance history together
+        
+        With use_batch, the server's /api/batch endpoint is tried first;
+        otherwise all four are fetched in parallel over the pooled session.
+        
+        Args:
+            errors_limit: Maximum number of errors to retrieve (default: 50)
+            perf_limit: Maximum number of performance records to retrieve (default: 100)
+        
+        Returns:
+            Dictionary with 'health', 'metrics', 'errors' and 'performance' payloads
+        """
+        keys = ('health', 'metrics', 'errors', 'performance')
+        
+        if self._use_batch:
+            batch = {
+                'requests': [
+                    {'path': '/api/health'},
+                    {'path': '/api/metrics'},
+                    {'path': '/api/errors', 'params': {'limit': errors_limit}},
+                    {'path': '/api/performance', 'params': {'limit': perf_limit}}
+                ]
+            }
+            try:
+                response = self._send_request('POST', '/api/batch', json=batch)
+                return dict(zip(keys, response['responses']))
+            except APIError as e:
+                if e.status_code not in (404, 405):
+                    raise
+                self._use_batch = False
+        
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            futures = {
+                'health': executor.submit(self.health_check),
+                'metrics': executor.submit(self.get_metrics),
+                'errors': executor.submit(self.get_errors, errors_limit),
+                'performance': executor.submit(self.get_performance_history, perf_limit)
+            }
+            return {key: future.result() for key, future in futures.items()}
     
     def log_test_error(self, error_type: str = "TEST_ERROR", 
                        message: str = "Test error from client") -> Dict:
@@ -219,22 +512,16 @@ class PerformanceMonitorClient:
         Args:
             function_name: Name of the function being monitored
         """
-        start_time = time.time()
+        start_ns = _perf_counter_ns()
         
         try:
             yield
         except Exception as e:
-            # Log the error
-            try:
-                self.log_test_error(
-                    error_type=type(e).__name__,
-                    message=f"{function_name}: {str(e)}"
-                )
-            except:
-                pass  # Don't fail if error logging fails
+            # Log the error in the background so the exception isn't held up
+            self._queue_error(type(e).__name__, f"{function_name}: {str(e)}")
             raise
         finally:
-            execution_time = time.time() - start_time
+            execution_time = (_perf_counter_ns() - start_ns) / 1e9
             print(f"[Monitor] {function_name} completed in {execution_time:.2f}s")
     
     def monitor_decorator(self, function_name: Optional[str] = None):
@@ -251,108 +538,291 @@ class PerformanceMonitorClient:
             function_name: Optional custom name (defaults to function.__name__)
         """
         def decorator(func):
-            @functools.wraps(func)
-            def wrapper(*args, **kwargs):
-                name = function_name or func.__name__
-                with self.monitor_function(name):
-                    return func(*args, **kwargs)
-            return wrapper
+            name = function_name or func.__name__
+            try:
+                return self._wrap(func, name)
+            except TypeError:
+                # Unhashable callables can't be cached, so wrap them each time
+                return self._build_wrapper(func, name)
         return decorator
+    
+    def _build_wrapper(self, func, name: str):
+        """Wrap func in monitor_function under the given name"""
+        # Skip copying __dict__, only the identifying attributes are needed
+        @functools.wraps(func, assigned=('__module__', '__name__', '__qualname__', '__doc__'), updated=())
+        def wrapper(*args, **kwargs):
+            with self.monitor_function(name):
+                return func(*args, **kwargs)
+        return wrapper
 
 
-class MonitoringStats:
-    """Helper class for analyzing monitoring data"""
+class AsyncPerformanceMonitorClient:
+    """Asyncio client for Performance Monitoring API
     
-    @staticmethod
-    def calculate_averages(metrics: List[Dict]) -> Dict[str, float]:
+    Usage:
+        async with AsyncPerformanceMonitorClient(api_url, api_key) as client:
+            metrics, errors, history = await asyncio.gather(
+                client.get_metrics(),
+                client.get_errors(),
+                client.get_performance_history()
+            )
+    """
+    
+    def __init__(self, api_url: str, api_key: str, timeout: int = 30, http2: bool = True):
         """
-        Calculate average values from metrics list
+        Initialize the client
+        
+        Args:
+            api_url: Base URL of the monitoring API (e.g., https://your-api.onrender.com)
+            api_key: Your API key
+            timeout: Request timeout in seconds (default: 30)
+            http2: Multiplex requests over one connection (requires httpx[http2])
+        """
+        if httpx is None:
+            raise ImportError("AsyncPerformanceMonitorClient requires httpx: pip install \"httpx[http2]\"")
+        
+        self.api_url = api_url.rstrip('/')
+        self.api_key = api_key
+        self.timeout = timeout
+        self._client = httpx.AsyncClient(
+            base_url=self.api_url,
+            http2=http2,
+            headers={'X-API-Key': api_key},
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20)
+        )
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, exc_type, exc_value, tb):
+        await self.aclose()
+    
+    async def aclose(self):
+        """Close pooled connections"""
+        await self._client.aclose()
+    
+    async def _make_request(self, method: str, endpoint: str, **kwargs) -> Dict:
+        """
+        Make HTTP request to the API
         
         Args:
-            metrics: List of metric dictionaries
+            method: HTTP method (GET, POST, etc.)
+            endpoint: API endpoint (e.g., /api/metrics)
+            **kwargs: Additional arguments for httpx
         
         Returns:
-            Dictionary of average values
+            Response JSON as dictionary
+        
+        Raises:
+            Exception: If request fails
         """
-        if not metrics:
-            return {}
+        try:
+            response = await self._client.request(method, endpoint, **kwargs)
+            response.raise_for_status()
+            return _loads(response.content)
+        
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 401:
+                raise APIError(f"Authentication failed. Check your API key.", 401)
+            else:
+                raise APIError(f"HTTP {e.response.status_code}: {e.response.text}", e.response.status_code)
+        
+        except httpx.TimeoutException:
+            raise Exception(f"Request timed out after {self.timeout} seconds")
+        
+        except httpx.ConnectError:
+            raise Exception(f"Failed to connect to {self.api_url}. Check URL and network.")
+        
+        except Exception as e:
+            raise Exception(f"Request failed: {str(e)}")
+    
+    async def health_check(self) -> Dict:
+        """Check API health status"""
+        # Health check doesn't require API key
+        request = self._client.build_request('GET', '/api/health')
+        del request.headers['X-API-Key']
+        response = await self._client.send(request)
+        response.raise_for_status()
+        return _loads(response.content)
+    
+    async def get_metrics(self) -> Dict:
+        """Get current system metrics"""
+        return await self._make_request('GET', '/api/metrics')
+    
+    async def get_errors(self, limit: int = 50, level: Optional[str] = None) -> Dict:
+        """Get error history, optionally filtered by level"""
+        params = {'limit': limit}
+        if level:
+            params['level'] = level
         
-        totals = {
-            'cpu_usage': 0,
-            'memory_usage': 0,
-            'disk_usage': 0,
-            'execution_time': 0
+        return await self._make_request('GET', '/api/errors', params=params)
+    
+    async def get_performance_history(self, limit: int = 100) -> Dict:
+        """Get performance metrics history"""
+        params = {'limit': limit}
+        return await self._make_request('GET', '/api/performance', params=params)
+    
+    async def get_thresholds(self) -> Dict:
+        """Get current performance thresholds"""
+        return await self._make_request('GET', '/api/thresholds')
+    
+    async def update_thresholds(self, thresholds: Dict[str, float]) -> Dict:
+        """Update performance thresholds"""
+        return await self._make_request('POST', '/api/thresholds', json=thresholds)
+    
+    async def log_test_error(self, error_type: str = "TEST_ERROR",
+                             message: str = "Test error from client") -> Dict:
+        """Log a test error"""
+        data = {
+            'type': error_type,
+            'message': message
+        }
+        return await self._make_request('POST', '/api/test-error', json=data)
+    
+    async def simulate_load(self, duration: int = 5, cpu_intensive: bool = True) -> Dict:
+        """Simulate system load for testing (duration max 10 seconds)"""
+        data = {
+            'duration': min(duration, 10),
+            'cpu_intensive': cpu_intensive
         }
+        return await self._make_request('POST', '/api/simulate-load', json=data)
+    
+    @asynccontextmanager
+    async def monitor_function(self, function_name: str):
+        """
+        Async context manager to monitor execution
         
-        for metric in metrics:
-            totals['cpu_usage'] += metric.get('cpu_usage', 0)
-            totals['memory_usage'] += metric.get('memory_usage', 0)
-            totals['disk_usage'] += metric.get('disk_usage', 0)
-            totals['execution_time'] += metric.get('execution_time', 0)
+        Usage:
+            async with client.monitor_function("my_function"):
+                await do_something()
+        
+        Args:
+            function_name: Name of the function being monitored
+        """
+        start_ns = _perf_counter_ns()
         
-        count = len(metrics)
-        return {key: value / count for key, value in totals.items()}
+        try:
+            yield
+        except Exception as e:
+            # Log the error
+            try:
+                await self.log_test_error(
+                    error_type=type(e).__name__,
+                    message=f"{function_name}: {str(e)}"
+                )
+            except:
+                pass  # Don't fail if error logging fails
+            raise
+        finally:
+            execution_time = (_perf_counter_ns() - start_ns) / 1e9
+            print(f"[Monitor] {function_name} completed in {execution_time:.2f}s")
+
+
+class MonitoringStats:
+    """Helper class for analyzing monitoring data"""
     
     @staticmethod
-    def find_peak_usage(metrics: List[Dict]) -> Dict[str, Any]:
+    def summarize(metrics: Iterable[Dict]) -> Dict[str, Dict]:
         """
-        Find peak resource usage from metrics
+        Calculate averages and peak usage in a single pass over metrics
         
         Args:
-            metrics: List of metric dictionaries
+            metrics: List or iterable of metric dictionaries, such as
+                     PerformanceMonitorClient.iter_performance_history()
         
         Returns:
-            Dictionary containing peak values and timestamps
+            Dictionary with 'averages' and 'peaks', as returned by
+            calculate_averages and find_peak_usage
         """
-        if not metrics:
-            return {}
+        keys = ('cpu_usage', 'memory_usage', 'disk_usage', 'execution_time')
         
-        peak = {
-            'cpu': {'value': 0, 'timestamp': None},
-            'memory': {'value': 0, 'timestamp': None},
-            'execution_time': {'value': 0, 'timestamp': None}
-        }
+        # One loop over any iterable; a list-of-lists for NumPy costs more than the loop itself
+        sum_cpu = sum_mem = sum_disk = sum_exec = 0
+        count = 0
+        peak_cpu_val = peak_mem_val = peak_exec_val = 0
+        peak_cpu = peak_mem = peak_exec = None
         
         for metric in metrics:
-            if metric.get('cpu_usage', 0) > peak['cpu']['value']:
-                peak['cpu'] = {
-                    'value': metric['cpu_usage'],
-                    'timestamp': metric.get('timestamp'),
-                    'function': metric.get('function_name')
-                }
-            
-            if metric.get('memory_usage', 0) > peak['memory']['value']:
-                peak['memory'] = {
-                    'value': metric['memory_usage'],
-                    'timestamp': metric.get('timestamp'),
-                    'function': metric.get('function_name')
-                }
+            get = metric.get
+            cpu = get('cpu_usage', 0)
+            mem = get('memory_usage', 0)
+            exec_time = get('execution_time', 0)
+            sum_cpu += cpu
+            sum_mem += mem
+            sum_disk += get('disk_usage', 0)
+            sum_exec += exec_time
+            count += 1
             
-            if metric.get('execution_time', 0) > peak['execution_time']['value']:
-                peak['execution_time'] = {
-                    'value': metric['execution_time'],
-                    'timestamp': metric.get('timestamp'),
-                    'function': metric.get('function_name')
-                }
+            if cpu > peak_cpu_val:
+                peak_cpu_val, peak_cpu = cpu, metric
+            if mem > peak_mem_val:
+                peak_mem_val, peak_mem = mem, metric
+            if exec_time > peak_exec_val:
+                peak_exec_val, peak_exec = exec_time, metric
+        
+        if not count:
+            return {'averages': {}, 'peaks': {}}
+        
+        averages = dict(zip(keys, (sum_cpu / count, sum_mem / count,
+                                   sum_disk / count, sum_exec / count)))
+        
+        def peak_entry(metric: Optional[Dict], key: str) -> Dict[str, Any]:
+            if metric is None:
+                return {'value': 0, 'timestamp': None}
+            return {
+                'value': metric[key],
+                'timestamp': metric.get('timestamp'),
+                'function': metric.get('function_name')
+            }
+        
+        return {
+            'averages': averages,
+            'peaks': {
+                'cpu': peak_entry(peak_cpu, 'cpu_usage'),
+                'memory': peak_entry(peak_mem, 'memory_usage'),
+                'execution_time': peak_entry(peak_exec, 'execution_time')
+            }
+        }
+    
+    @staticmethod
+    def calculate_averages(metrics: Iterable[Dict]) -> Dict[str, float]:
+        """
+        Calculate average values from metrics list
+        
+        Args:
+            metrics: List or iterable of metric dictionaries
         
-        return peak
+        Returns:
+            Dictionary of average values
+        """
+        return MonitoringStats.summarize(metrics)['averages']
     
     @staticmethod
-    def count_errors_by_type(errors: List[Dict]) -> Dict[str, int]:
+    def find_peak_usage(metrics: Iterable[Dict]) -> Dict[str, Any]:
+        """
+        Find peak resource usage from metrics
+        
+        Args:
+            metrics: List or iterable of metric dictionaries
+        
+        Returns:
+            Dictionary containing peak values and timestamps
+        """
+        return MonitoringStats.summarize(metrics)['peaks']
+    
+    @staticmethod
+    def count_errors_by_type(errors: Iterable[Dict]) -> Dict[str, int]:
         """
         Count errors by type
         
         Args:
-            errors: List of error dictionaries
+            errors: List or iterable of error dictionaries
         
         Returns:
             Dictionary mapping error types to counts
         """
-        counts = {}
-        for error in errors:
-            error_type = error.get('error_type', 'UNKNOWN')
-            counts[error_type] = counts.get(error_type, 0) + 1
-        return counts
+        return dict(Counter(error.get('error_type', 'UNKNOWN') for error in errors))
 
 
 # Example usage
@@ -421,6 +891,9 @@ if __name__ == "__main__":
     except Exception as e:
         print(f"   Error: {e}")
     
+    # Send any errors still queued by monitor_function
+    client.close()
+    
     print("\n" + "=" * 60)
     print("Example completed!")
     print("=" * 60)
\ No newline at end of file